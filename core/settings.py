@@ -11,6 +11,7 @@ class ToolSettings:
     autoriser_multi_rc: bool = True
     max_rc_par_lettrage: int = 2
     max_candidats_par_rc: int = 10
+    budget_memoire_mo: int | None = None
 
 
 DEFAULT_SETTINGS = ToolSettings()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from datetime import date
 from typing import Iterable
 
@@ -34,3 +35,14 @@ def score_proximite_dates(non_rc_dates: Iterable[date], rc_dates: Iterable[date]
         diffs = [abs((piece_date - rc_date).days) for rc_date in rc_list]
         total += min(diffs) if diffs else 0
     return total
+
+
+def current_rss_mo() -> float:
+    # Mémoire résidente courante (et non le pic depuis le démarrage du processus, qui ne redescend
+    # jamais). Disponible sous Linux uniquement ; 0.0 si non mesurable.
+    try:
+        with open("/proc/self/statm", "rb") as handle:
+            resident_pages = int(handle.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0.0
+    return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
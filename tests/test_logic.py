@@ -1,11 +1,22 @@
+import gzip
 from datetime import date
 
 import pandas as pd
+import pytest
 
+from core.settings import ToolSettings
+from tools.revue_lettrage_balance import logic
 from tools.revue_lettrage_balance.logic import (
+    EXPORT_CHUNK_ROWS,
+    EXPORT_MIN_CHUNK_ROWS,
     LettrageCandidate,
+    build_reachable_sums,
+    export_chunk_rows,
+    is_target_reachable,
     run_lettrage,
+    run_sweep,
     select_best_candidates_by_rc,
+    write_outputs,
 )
 
 
@@ -47,6 +58,39 @@ def _sample_df():
     return pd.DataFrame(data)
 
 
+def _tier_df(non_rc_amounts, rc_amounts):
+    template = _sample_df().iloc[0].to_dict()
+    rows = []
+    for idx, amount in enumerate(non_rc_amounts + rc_amounts):
+        is_rc = idx >= len(non_rc_amounts)
+        rows.append(
+            {
+                **template,
+                "id_ligne": idx,
+                "No facture": f"F{idx}",
+                "Type de pièce": "RC" if is_rc else "FV",
+                "Date d'échéance": date(2024, 1, 1 + idx),
+                "montant_cents": amount,
+                "montant_eur": amount / 100,
+                "Numéro d'écriture": f"E{idx}",
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+def _run_with_settings(df, settings):
+    return run_lettrage(
+        df,
+        today=date(2024, 2, 1),
+        tolerance_eur=settings.tolerance_eur,
+        max_k_lignes_non_rc=settings.max_k_lignes_non_rc,
+        max_lignes_par_tiers=settings.max_lignes_par_tiers,
+        autoriser_multi_rc=settings.autoriser_multi_rc,
+        max_rc_par_lettrage=settings.max_rc_par_lettrage,
+        max_candidats_par_rc=settings.max_candidats_par_rc,
+    )
+
+
 def test_select_best_candidate_by_rc():
     candidate_a = LettrageCandidate(
         code_tiers="T1",
@@ -97,3 +141,172 @@ def test_run_lettrage_basic():
     assert result.metrics["lettrages_retenus"] == 1
     assert len(result.lignes_lettrees) == 2
     assert result.lignes_restantes.empty
+    assert result.metrics["groupes_rc"] == 1
+    assert result.metrics["groupes_rc_elagues"] == 0
+    assert result.metrics["tiers_index_ignores"] == 0
+
+
+def test_run_lettrage_writes_outputs_to_disk(tmp_path):
+    df = _sample_df()
+    result = run_lettrage(
+        df,
+        today=date(2024, 2, 1),
+        tolerance_eur=0.05,
+        max_k_lignes_non_rc=2,
+        max_lignes_par_tiers=200,
+        autoriser_multi_rc=True,
+        max_rc_par_lettrage=2,
+        max_candidats_par_rc=50,
+        dossier_sortie=tmp_path,
+    )
+    assert result.metrics["lettrages_retenus"] == 1
+    assert result.lignes_lettrees.empty
+    lignes_lettrees = pd.read_csv(result.exports["lignes_lettrees"])
+    assert lignes_lettrees["id_lettrage"].tolist() == ["LET-0001", "LET-0001"]
+    assert pd.read_csv(result.exports["lignes_restantes"]).empty
+
+
+def test_run_lettrage_measures_memory_per_stage(monkeypatch):
+    # Une première mesure élevée (calcul lourd précédent) ne doit pas se reporter sur les étapes suivantes.
+    readings = iter([500.0])
+    monkeypatch.setattr(logic, "current_rss_mo", lambda: next(readings, 50.0))
+    result = run_lettrage(
+        _sample_df(),
+        today=date(2024, 2, 1),
+        tolerance_eur=0.05,
+        max_k_lignes_non_rc=2,
+        max_lignes_par_tiers=200,
+        autoriser_multi_rc=True,
+        max_rc_par_lettrage=2,
+        max_candidats_par_rc=50,
+        budget_memoire_mo=1000,
+    )
+    assert result.metrics["rss_pic_mo_filtrage"] == 500.0
+    assert result.metrics["rss_pic_mo_candidats"] == 50.0
+    assert result.metrics["rss_pic_mo_sorties"] == 50.0
+
+
+def test_export_chunk_rows_follows_memory_budget():
+    df = pd.concat([_sample_df()] * 1000, ignore_index=True)
+    assert export_chunk_rows(df, None, 0.0) == EXPORT_CHUNK_ROWS
+    assert export_chunk_rows(df, 100, 99.0) < export_chunk_rows(df, 100, 10.0)
+    assert export_chunk_rows(df, 100, 200.0) == EXPORT_MIN_CHUNK_ROWS
+
+
+def test_run_lettrage_disk_outputs_match_memory_outputs(tmp_path):
+    df = _tier_df([100, 700, 200, 300], rc_amounts=[-300, -800])
+    settings = ToolSettings(max_k_lignes_non_rc=2)
+    in_memory = _run_with_settings(df, settings)
+    on_disk = run_lettrage(
+        df,
+        today=date(2024, 2, 1),
+        tolerance_eur=settings.tolerance_eur,
+        max_k_lignes_non_rc=settings.max_k_lignes_non_rc,
+        max_lignes_par_tiers=settings.max_lignes_par_tiers,
+        autoriser_multi_rc=settings.autoriser_multi_rc,
+        max_rc_par_lettrage=settings.max_rc_par_lettrage,
+        max_candidats_par_rc=settings.max_candidats_par_rc,
+        dossier_sortie=tmp_path,
+    )
+    _, small_chunks = write_outputs(df, in_memory.lettrages, tmp_path / "blocs", chunk_rows=1)
+    assert in_memory.metrics["lettrages_retenus"] == 2
+    for name, frame in [
+        ("lignes_lettrees", in_memory.lignes_lettrees),
+        ("lignes_restantes", in_memory.lignes_restantes),
+    ]:
+        for exports in (on_disk.exports, small_chunks):
+            with gzip.open(exports[name], "rt", encoding="utf-8") as handle:
+                assert handle.read() == frame.to_csv(index=False)
+
+
+def test_run_lettrage_memory_budget_exceeded(monkeypatch):
+    monkeypatch.setattr(logic, "current_rss_mo", lambda: 100.0)
+    df = _sample_df()
+    with pytest.raises(MemoryError):
+        run_lettrage(
+            df,
+            today=date(2024, 2, 1),
+            tolerance_eur=0.05,
+            max_k_lignes_non_rc=2,
+            max_lignes_par_tiers=200,
+            autoriser_multi_rc=True,
+            max_rc_par_lettrage=2,
+            max_candidats_par_rc=50,
+            budget_memoire_mo=1,
+        )
+
+
+def test_run_sweep_matches_individual_runs():
+    df = _sample_df()
+    df.loc[0, "montant_cents"] = 10003
+    grid = [
+        ToolSettings(tolerance_eur=0.05, max_k_lignes_non_rc=2),
+        ToolSettings(tolerance_eur=0.02, max_k_lignes_non_rc=1),
+    ]
+    sweep = run_sweep(df, today=date(2024, 2, 1), settings_grid=grid)
+    assert sweep.metrics["enumerations"] == 1
+    assert sweep.comparaison["lettrages_retenus"].tolist() == [1, 0]
+    assert sweep.comparaison["lignes_couvertes"].tolist() == [2, 0]
+    assert sweep.comparaison["ecart"].tolist() == [0.03, 0.0]
+    for settings, lettrages in zip(grid, sweep.lettrages):
+        assert lettrages == _run_with_settings(df, settings).lettrages
+
+
+def test_run_sweep_reruns_truncated_groups_and_splits_by_max_lines():
+    # Avec une tolérance de 0,05 €, les deux premiers résultats (998 et 1002) saturent la limite de
+    # candidats : la configuration stricte doit relancer la recherche pour trouver 500 + 500 et 1000.
+    df = _tier_df([998, 1002, 500, 500, 1000], rc_amounts=[-1000])
+    grid = [
+        ToolSettings(tolerance_eur=0.05, max_k_lignes_non_rc=3, max_candidats_par_rc=2),
+        ToolSettings(tolerance_eur=0.0, max_k_lignes_non_rc=2, max_candidats_par_rc=2),
+        ToolSettings(tolerance_eur=0.0, max_k_lignes_non_rc=2, max_candidats_par_rc=2, max_lignes_par_tiers=4),
+    ]
+    sweep = run_sweep(df, today=date(2024, 2, 1), settings_grid=grid)
+    assert sweep.metrics["relances"] > 0
+    assert sweep.metrics["enumerations"] == 2
+    assert sweep.comparaison["groupes_rc"].tolist() == [1, 1, 1]
+    # Limité à 4 lignes, le tiers ne garde que 998, 1002 et 500 : aucun lettrage exact possible.
+    assert sweep.comparaison["lettrages_retenus"].tolist() == [1, 1, 0]
+    assert sweep.comparaison["ecart"].tolist() == [0.02, 0.0, 0.0]
+    for settings, lettrages in zip(grid, sweep.lettrages):
+        assert lettrages == _run_with_settings(df, settings).lettrages
+
+
+@pytest.mark.parametrize("max_cents", [logic.REACHABILITY_MAX_CENTS, 0])
+def test_reachable_sums_respect_max_k_and_negatives(monkeypatch, max_cents):
+    # max_cents = 0 force la table creuse utilisée quand la plage de sommes est trop large.
+    monkeypatch.setattr(logic, "REACHABILITY_MAX_CENTS", max_cents)
+    reachable = build_reachable_sums([500, 300, -200, 1000], max_k=2, max_target=1200)
+    assert is_target_reachable(reachable, 800, 0)
+    assert is_target_reachable(reachable, 300, 0)
+    assert not is_target_reachable(reachable, 1100, 0)
+    assert not is_target_reachable(reachable, 650, 40)
+    assert is_target_reachable(reachable, 760, 40)
+
+
+def test_run_lettrage_prunes_unreachable_rc_groups(monkeypatch):
+    # Aucune combinaison de 10 000 et 2 500 ne donne 5 000 ni 7 000 : ces RC sont écartés sans recherche.
+    df = _tier_df([10000, 2500], rc_amounts=[-10000, -5000, -2500, -7000])
+    settings = ToolSettings(max_k_lignes_non_rc=2, autoriser_multi_rc=False)
+
+    result = _run_with_settings(df, settings)
+    assert result.metrics["groupes_rc"] == 4
+    assert result.metrics["groupes_rc_elagues"] == 2
+    assert result.metrics["tiers_index_ignores"] == 0
+
+    monkeypatch.setattr(logic, "REACHABILITY_MAX_CENTS", 0)
+    monkeypatch.setattr(logic, "REACHABILITY_MAX_SUMS", 0)
+    unpruned = _run_with_settings(df, settings)
+    assert unpruned.metrics["groupes_rc_elagues"] == 0
+    assert unpruned.metrics["tiers_index_ignores"] == 1
+    assert unpruned.lettrages == result.lettrages
+    assert result.metrics["lettrages_retenus"] == 2
+
+
+def test_reachability_index_not_built_for_few_groups(monkeypatch):
+    def fail(*args):
+        raise AssertionError("index construit pour un tiers à un seul groupe de RC")
+
+    monkeypatch.setattr(logic, "build_reachable_sums", fail)
+    result = _run_with_settings(_sample_df(), ToolSettings(max_k_lignes_non_rc=2))
+    assert result.metrics["lettrages_retenus"] == 1
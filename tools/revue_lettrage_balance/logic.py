@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import bisect
 import itertools
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import date
-from typing import Iterable
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence
 
 import pandas as pd
 
-from core.utils import cents_to_eur, score_proximite_dates
+from core.settings import ToolSettings
+from core.utils import cents_to_eur, current_rss_mo, score_proximite_dates
+
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_MIN_CHUNK_ROWS = 1_000
+EXPORT_BUDGET_FRACTION = 0.1
+REACHABILITY_MAX_CENTS = 1 << 23
+REACHABILITY_MAX_SUMS = 50_000
+REACHABILITY_MIN_GROUPS = 4
 
 
 @dataclass(frozen=True)
@@ -35,6 +45,50 @@ class LettrageResult:
     lignes_lettrees: pd.DataFrame
     lignes_restantes: pd.DataFrame
     metrics: dict[str, int | float]
+    exports: dict[str, Path] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class SweepResult:
+    comparaison: pd.DataFrame
+    lettrages: list[list[LettrageCandidate]]
+    metrics: dict[str, int | float]
+
+
+@dataclass(frozen=True)
+class ReachableSums:
+    offset: int
+    bits: bytes = b""
+    sorted_sums: tuple[int, ...] | None = None
+
+
+@dataclass
+class _MemoryMonitor:
+    budget_mo: int | None
+    metrics: dict[str, int | float]
+    stage_peak_mo: float = 0.0
+
+    def sample(self, stage: str) -> float:
+        rss_mo = current_rss_mo()
+        self.stage_peak_mo = max(self.stage_peak_mo, rss_mo)
+        if self.budget_mo is not None and rss_mo > self.budget_mo:
+            raise MemoryError(
+                f"Budget mémoire dépassé à l'étape {stage}: {rss_mo} Mo > {self.budget_mo} Mo"
+            )
+        return rss_mo
+
+    def end_stage(self, stage: str) -> None:
+        self.sample(stage)
+        self.metrics[f"rss_pic_mo_{stage}"] = self.stage_peak_mo
+        self.stage_peak_mo = 0.0
+
+
+@dataclass(frozen=True)
+class _GroupEnumeration:
+    rc_ids: tuple[int, ...]
+    rc_sum: int
+    candidates: list[LettrageCandidate]
+    truncated: bool
 
 
 def filter_base(df: pd.DataFrame, today: date) -> pd.DataFrame:
@@ -98,89 +152,228 @@ def _find_combinations(
     return results
 
 
-def build_candidates_for_tier(
-    df: pd.DataFrame,
+def build_reachable_sums(
+    amounts: list[int],
+    max_k: int,
+    max_target: int,
+) -> ReachableSums | None:
+    # Sommes atteignables avec 1 à max_k lignes, décalées de offset pour gérer les lignes négatives.
+    # Les sommes partielles au-delà de max_target + offset ne peuvent plus redescendre dans la cible,
+    # même avec les lignes négatives restantes.
+    offset = -sum(sorted(amount for amount in amounts if amount < 0)[:max_k])
+    width = max_target + 2 * offset + 1
+    if width <= REACHABILITY_MAX_CENTS:
+        return _build_reachable_bitset(amounts, max_k, offset, width)
+    return _build_reachable_table(amounts, max_k, max_target + offset)
+
+
+def _build_reachable_bitset(amounts: list[int], max_k: int, offset: int, width: int) -> ReachableSums:
+    # Bitset par cardinalité : le bit i du niveau j indique une somme (i - offset) atteignable
+    # avec exactement j lignes.
+    mask = (1 << width) - 1
+    levels = [1 << offset] + [0] * max_k
+    for amount in amounts:
+        for j in range(max_k, 0, -1):
+            previous = levels[j - 1]
+            if previous:
+                shifted = previous << amount if amount >= 0 else previous >> -amount
+                levels[j] |= shifted & mask
+    bits = 0
+    for level in levels[1:]:
+        bits |= level
+    return ReachableSums(offset=offset, bits=bits.to_bytes((width + 7) // 8, "little"))
+
+
+def _build_reachable_table(amounts: list[int], max_k: int, upper: int) -> ReachableSums | None:
+    # Plage trop large pour un bitset : ensembles creux par cardinalité, abandonnés s'ils grossissent trop.
+    levels: list[set[int]] = [{0}] + [set() for _ in range(max_k)]
+    for amount in amounts:
+        for j in range(max_k, 0, -1):
+            if levels[j - 1]:
+                levels[j].update(total + amount for total in levels[j - 1] if total + amount <= upper)
+        if sum(len(level) for level in levels) > REACHABILITY_MAX_SUMS:
+            return None
+    return ReachableSums(offset=0, sorted_sums=tuple(sorted(set().union(*levels[1:]))))
+
+
+def is_target_reachable(reachable_sums: ReachableSums, target: int, tolerance: int) -> bool:
+    if reachable_sums.sorted_sums is not None:
+        sums = reachable_sums.sorted_sums
+        idx = bisect.bisect_left(sums, target - tolerance)
+        return idx < len(sums) and sums[idx] <= target + tolerance
+    low = max(target - tolerance + reachable_sums.offset, 0)
+    high = target + tolerance + reachable_sums.offset
+    if high < low:
+        return False
+    # Seuls les octets couvrant la fenêtre sont lus : le coût dépend de la tolérance, pas de la plage.
+    window = int.from_bytes(reachable_sums.bits[low // 8 : high // 8 + 1], "little") >> (low % 8)
+    return bool(window & ((1 << (high - low + 1)) - 1))
+
+
+def _reachable_groups(
+    groups: list[tuple[tuple[int, ...], int]],
+    non_rc_amounts: list[tuple[int, int]],
     tolerance_cents: int,
     max_k: int,
+    stats: dict[str, int] | None,
+) -> list[tuple[tuple[int, ...], int]]:
+    groups = [(rc_ids, rc_sum) for rc_ids, rc_sum in groups if rc_sum < 0]
+    index_ignored = False
+    kept = groups
+    # Construire l'index coûte plus que quelques recherches : il ne sert qu'à partir de plusieurs groupes.
+    if len(groups) >= REACHABILITY_MIN_GROUPS:
+        max_target = max(-rc_sum for _, rc_sum in groups) + tolerance_cents
+        reachable_sums = build_reachable_sums([amount for _, amount in non_rc_amounts], max_k, max_target)
+        index_ignored = reachable_sums is None
+        if reachable_sums is not None:
+            kept = [
+                (rc_ids, rc_sum)
+                for rc_ids, rc_sum in groups
+                if is_target_reachable(reachable_sums, -rc_sum, tolerance_cents)
+            ]
+    if stats is not None:
+        stats["tiers_index_ignores"] = stats.get("tiers_index_ignores", 0) + int(index_ignored)
+        stats["groupes_rc"] = stats.get("groupes_rc", 0) + len(groups)
+        stats["groupes_rc_elagues"] = stats.get("groupes_rc_elagues", 0) + len(groups) - len(kept)
+    return kept
+
+
+def _rc_groups(
+    rc_df: pd.DataFrame,
     allow_multi_rc: bool,
     max_rc_per_lettrage: int,
-    max_candidates_per_rc: int,
-) -> list[LettrageCandidate]:
-    if df.empty:
-        return []
-    code_tiers = str(df["Code Tiers"].iloc[0])
-    raison_sociale = str(df["Raison sociale"].iloc[0])
+) -> list[tuple[tuple[int, ...], int]]:
+    rc_rows = [(int(row.id_ligne), int(row.montant_cents)) for _, row in rc_df.iterrows()]
+    groups = [((rc_id,), amount) for rc_id, amount in rc_rows]
+    if allow_multi_rc and max_rc_per_lettrage >= 2:
+        for (id_a, amount_a), (id_b, amount_b) in itertools.combinations(rc_rows, 2):
+            groups.append(((id_a, id_b), amount_a + amount_b))
+    return groups
 
-    if should_skip_tier(df, tolerance_cents):
-        return []
 
+def _make_candidate(
+    df: pd.DataFrame,
+    rc_ids: tuple[int, ...],
+    non_rc_ids: tuple[int, ...],
+    tolerance_cents: int,
+) -> LettrageCandidate | None:
+    selected_df = df[df["id_ligne"].isin(rc_ids + non_rc_ids)]
+    sum_cents = int(selected_df["montant_cents"].sum())
+    ecart_cents = abs(sum_cents)
+    if ecart_cents > tolerance_cents:
+        return None
+    rc_dates = [row["Date d'échéance"] for _, row in selected_df.iterrows() if row["Type de pièce"] == "RC"]
+    non_rc_dates = [
+        row["Date d'échéance"] for _, row in selected_df.iterrows() if row["Type de pièce"] != "RC"
+    ]
+    score = score_proximite_dates(non_rc_dates, rc_dates)
+    date_min = selected_df["Date d'échéance"].min()
+    date_max = selected_df["Date d'échéance"].max()
+    no_facture = ", ".join(selected_df["No facture"].astype(str).unique())
+    numero_ecriture = ", ".join(selected_df["Numéro d'écriture"].astype(str).unique())
+    return LettrageCandidate(
+        code_tiers=str(df["Code Tiers"].iloc[0]),
+        raison_sociale=str(df["Raison sociale"].iloc[0]),
+        rc_ids=rc_ids,
+        non_rc_ids=non_rc_ids,
+        sum_cents=sum_cents,
+        ecart_cents=ecart_cents,
+        score_proximite_date=score,
+        nb_lignes=len(selected_df),
+        nb_rc=len(rc_ids),
+        date_min=date_min,
+        date_max=date_max,
+        no_facture_resume=no_facture,
+        numero_ecriture_resume=numero_ecriture,
+    )
+
+
+def _split_tier(
+    df: pd.DataFrame,
+    tolerance_cents: int,
+) -> tuple[pd.DataFrame, list[tuple[int, int]]] | None:
+    if df.empty or should_skip_tier(df, tolerance_cents):
+        return None
     rc_df = df[(df["Type de pièce"] == "RC") & (df["montant_cents"] < 0)]
     non_rc_df = df[df["Type de pièce"] != "RC"]
     if rc_df.empty or non_rc_df.empty:
-        return []
-
-    rc_groups: list[list[pd.Series]] = []
-    rc_rows = [row for _, row in rc_df.iterrows()]
-    for row in rc_rows:
-        rc_groups.append([row])
-    if allow_multi_rc and max_rc_per_lettrage >= 2:
-        for row_a, row_b in itertools.combinations(rc_rows, 2):
-            rc_groups.append([row_a, row_b])
-
+        return None
     non_rc_amounts = [(int(row.id_ligne), int(row.montant_cents)) for _, row in non_rc_df.iterrows()]
-    candidates: list[LettrageCandidate] = []
+    return rc_df, non_rc_amounts
 
-    for rc_group in rc_groups:
-        rc_ids = tuple(int(row.id_ligne) for row in rc_group)
-        rc_sum = sum(int(row.montant_cents) for row in rc_group)
-        target = -rc_sum
-        if target <= 0:
-            continue
+
+def iter_candidates_for_tier(
+    df: pd.DataFrame,
+    tolerance_cents: int,
+    max_k: int,
+    allow_multi_rc: bool,
+    max_rc_per_lettrage: int,
+    max_candidates_per_rc: int,
+    stats: dict[str, int] | None = None,
+) -> Iterator[list[LettrageCandidate]]:
+    # Produit les candidats groupe de RC par groupe de RC, pour ne jamais garder ceux de tout le tiers.
+    split = _split_tier(df, tolerance_cents)
+    if split is None:
+        return
+    rc_df, non_rc_amounts = split
+
+    groups = _reachable_groups(
+        _rc_groups(rc_df, allow_multi_rc, max_rc_per_lettrage),
+        non_rc_amounts,
+        tolerance_cents,
+        max_k,
+        stats,
+    )
+    for rc_ids, rc_sum in groups:
         combos = _find_combinations(
             non_rc_amounts,
-            target=target,
+            target=-rc_sum,
             tolerance=tolerance_cents,
             max_k=max_k,
             max_results=max_candidates_per_rc,
         )
+        group_candidates: list[LettrageCandidate] = []
         for combo in combos:
-            non_rc_ids = tuple(combo)
-            selected_df = df[df["id_ligne"].isin(rc_ids + non_rc_ids)]
-            sum_cents = int(selected_df["montant_cents"].sum())
-            ecart_cents = abs(sum_cents)
-            if ecart_cents > tolerance_cents:
-                continue
-            rc_dates = [row["Date d'échéance"] for _, row in selected_df.iterrows() if row["Type de pièce"] == "RC"]
-            non_rc_dates = [
-                row["Date d'échéance"] for _, row in selected_df.iterrows() if row["Type de pièce"] != "RC"
-            ]
-            score = score_proximite_dates(non_rc_dates, rc_dates)
-            date_min = selected_df["Date d'échéance"].min()
-            date_max = selected_df["Date d'échéance"].max()
-            no_facture = ", ".join(selected_df["No facture"].astype(str).unique())
-            numero_ecriture = ", ".join(selected_df["Numéro d'écriture"].astype(str).unique())
-            candidates.append(
-                LettrageCandidate(
-                    code_tiers=code_tiers,
-                    raison_sociale=raison_sociale,
-                    rc_ids=rc_ids,
-                    non_rc_ids=non_rc_ids,
-                    sum_cents=sum_cents,
-                    ecart_cents=ecart_cents,
-                    score_proximite_date=score,
-                    nb_lignes=len(selected_df),
-                    nb_rc=len(rc_ids),
-                    date_min=date_min,
-                    date_max=date_max,
-                    no_facture_resume=no_facture,
-                    numero_ecriture_resume=numero_ecriture,
-                )
-            )
-    return candidates
+            candidate = _make_candidate(df, rc_ids, tuple(combo), tolerance_cents)
+            if candidate is not None:
+                group_candidates.append(candidate)
+        yield group_candidates
+
+
+def build_candidates_for_tier(
+    df: pd.DataFrame,
+    tolerance_cents: int,
+    max_k: int,
+    allow_multi_rc: bool,
+    max_rc_per_lettrage: int,
+    max_candidates_per_rc: int,
+    stats: dict[str, int] | None = None,
+) -> list[LettrageCandidate]:
+    return [
+        candidate
+        for group_candidates in iter_candidates_for_tier(
+            df,
+            tolerance_cents,
+            max_k,
+            allow_multi_rc,
+            max_rc_per_lettrage,
+            max_candidates_per_rc,
+            stats,
+        )
+        for candidate in group_candidates
+    ]
 
 
 def select_best_candidates_by_rc(candidates: Iterable[LettrageCandidate]) -> dict[int, LettrageCandidate]:
     best: dict[int, LettrageCandidate] = {}
+    update_best_candidates_by_rc(best, candidates)
+    return best
+
+
+def update_best_candidates_by_rc(
+    best: dict[int, LettrageCandidate],
+    candidates: Iterable[LettrageCandidate],
+) -> None:
     for candidate in candidates:
         for rc_id in candidate.rc_ids:
             existing = best.get(rc_id)
@@ -189,7 +382,6 @@ def select_best_candidates_by_rc(candidates: Iterable[LettrageCandidate]) -> dic
                 continue
             if _is_better_candidate(candidate, existing):
                 best[rc_id] = candidate
-    return best
 
 
 def _is_better_candidate(a: LettrageCandidate, b: LettrageCandidate) -> bool:
@@ -220,6 +412,24 @@ def resolve_candidates(best_candidates: Iterable[LettrageCandidate]) -> list[Let
     return selected
 
 
+def _lettrage_row(lettrage_id: str, candidate: LettrageCandidate) -> dict[str, object]:
+    return {
+        "id_lettrage": lettrage_id,
+        "Code Tiers": candidate.code_tiers,
+        "Raison sociale": candidate.raison_sociale,
+        "nb_lignes": candidate.nb_lignes,
+        "somme": cents_to_eur(candidate.sum_cents),
+        "ecart": cents_to_eur(candidate.ecart_cents),
+        "nb_rc": candidate.nb_rc,
+        "date_echeance_min": candidate.date_min,
+        "date_echeance_max": candidate.date_max,
+        "score_proximite_date": candidate.score_proximite_date,
+        "no_facture": candidate.no_facture_resume,
+        "numero_ecriture": candidate.numero_ecriture_resume,
+        "ids_lignes": ",".join(map(str, candidate.rc_ids + candidate.non_rc_ids)),
+    }
+
+
 def build_outputs(
     df: pd.DataFrame,
     selected: list[LettrageCandidate],
@@ -234,23 +444,7 @@ def build_outputs(
         lines["id_lettrage"] = lettrage_id
         lignes_lettrees_rows.append(lines)
         used_lines.update(lines["id_ligne"].tolist())
-        lettrage_rows.append(
-            {
-                "id_lettrage": lettrage_id,
-                "Code Tiers": candidate.code_tiers,
-                "Raison sociale": candidate.raison_sociale,
-                "nb_lignes": candidate.nb_lignes,
-                "somme": cents_to_eur(candidate.sum_cents),
-                "ecart": cents_to_eur(candidate.ecart_cents),
-                "nb_rc": candidate.nb_rc,
-                "date_echeance_min": candidate.date_min,
-                "date_echeance_max": candidate.date_max,
-                "score_proximite_date": candidate.score_proximite_date,
-                "no_facture": candidate.no_facture_resume,
-                "numero_ecriture": candidate.numero_ecriture_resume,
-                "ids_lignes": ",".join(map(str, candidate.rc_ids + candidate.non_rc_ids)),
-            }
-        )
+        lettrage_rows.append(_lettrage_row(lettrage_id, candidate))
 
     lettrages_df = pd.DataFrame(lettrage_rows)
     lignes_lettrees_df = pd.concat(lignes_lettrees_rows, ignore_index=True) if lignes_lettrees_rows else df.head(0)
@@ -258,6 +452,70 @@ def build_outputs(
     return lettrages_df, lignes_lettrees_df, lignes_restantes_df
 
 
+def write_outputs(
+    df: pd.DataFrame,
+    selected: list[LettrageCandidate],
+    output_dir: str | Path,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    on_chunk: Callable[[], object] | None = None,
+) -> tuple[pd.DataFrame, dict[str, Path]]:
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    exports = {
+        "lettrages_synthese": output_path / "lettrages_synthese.csv",
+        "lignes_lettrees": output_path / "lignes_lettrees.csv.gz",
+        "lignes_restantes": output_path / "lignes_restantes.csv.gz",
+    }
+
+    lettrage_ids = [f"LET-{idx:04d}" for idx in range(1, len(selected) + 1)]
+    lettrages_df = pd.DataFrame(
+        [_lettrage_row(lettrage_id, candidate) for lettrage_id, candidate in zip(lettrage_ids, selected)]
+    )
+    lettrages_df.to_csv(exports["lettrages_synthese"], index=False)
+
+    # Les lignes sont écrites par blocs, chacun ajouté comme un membre gzip : le fichier reste un gzip
+    # valide sans jamais matérialiser de copie complète. L'ordre est celui de build_outputs.
+    positions = pd.Series(range(len(df)), index=df["id_ligne"].to_numpy())
+    lettrees_header = True
+    batch_positions: list[int] = []
+    batch_ids: list[str] = []
+    for lettrage_id, candidate in zip(lettrage_ids, selected):
+        lettrage_positions = sorted(positions[list(candidate.rc_ids + candidate.non_rc_ids)])
+        batch_positions.extend(lettrage_positions)
+        batch_ids.extend([lettrage_id] * len(lettrage_positions))
+        if len(batch_positions) >= chunk_rows or lettrage_id == lettrage_ids[-1]:
+            lettrees = df.iloc[batch_positions].assign(id_lettrage=batch_ids)
+            _append_csv_gz(lettrees, exports["lignes_lettrees"], lettrees_header)
+            lettrees_header = False
+            batch_positions, batch_ids = [], []
+            if on_chunk is not None:
+                on_chunk()
+    if lettrees_header:
+        _append_csv_gz(df.head(0), exports["lignes_lettrees"], True)
+
+    used_lines = {line_id for candidate in selected for line_id in candidate.rc_ids + candidate.non_rc_ids}
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start : start + chunk_rows]
+        _append_csv_gz(chunk[~chunk["id_ligne"].isin(used_lines)], exports["lignes_restantes"], start == 0)
+        if on_chunk is not None:
+            on_chunk()
+    return lettrages_df, exports
+
+
+def _append_csv_gz(df: pd.DataFrame, path: Path, header: bool) -> None:
+    df.to_csv(path, index=False, mode="w" if header else "a", header=header, compression="gzip")
+
+
+def export_chunk_rows(df: pd.DataFrame, budget_mo: int | None, rss_mo: float) -> int:
+    if budget_mo is None or df.empty:
+        return EXPORT_CHUNK_ROWS
+    bytes_per_row = df.memory_usage(deep=True).sum() / len(df)
+    headroom = max(budget_mo - rss_mo, 0.0) * 1024 * 1024
+    # Un bloc est copié jusqu'à trois fois : sélection, ajout de id_lettrage et tampon CSV.
+    rows = int(headroom * EXPORT_BUDGET_FRACTION / (3 * bytes_per_row))
+    return max(EXPORT_MIN_CHUNK_ROWS, min(EXPORT_CHUNK_ROWS, rows))
+
+
 def run_lettrage(
     df: pd.DataFrame,
     today: date,
@@ -267,36 +525,67 @@ def run_lettrage(
     autoriser_multi_rc: bool,
     max_rc_par_lettrage: int,
     max_candidats_par_rc: int,
+    budget_memoire_mo: int | None = None,
+    dossier_sortie: str | Path | None = None,
 ) -> LettrageResult:
     start = time.perf_counter()
     tolerance_cents = int(round(tolerance_eur * 100))
+    memory_metrics: dict[str, int | float] = {}
+    monitor = _MemoryMonitor(budget_memoire_mo, memory_metrics)
 
     filtered_df = filter_base(df, today)
     tiers_total = filtered_df["Code Tiers"].nunique()
-    candidates: list[LettrageCandidate] = []
+    monitor.end_stage("filtrage")
 
+    # Les candidats sont réduits au meilleur par RC dès la fin de chaque groupe de RC : le résultat est
+    # le même qu'une réduction globale, mais seuls les candidats d'un groupe sont gardés à la fois.
+    best_by_rc: dict[int, LettrageCandidate] = {}
+    candidates_total = 0
+    pruning_stats: dict[str, int] = {"groupes_rc": 0, "groupes_rc_elagues": 0, "tiers_index_ignores": 0}
     for _, tier_df in filtered_df.groupby("Code Tiers"):
         reduced_df = reduce_tier_lines(tier_df, max_lignes_par_tiers)
-        tier_candidates = build_candidates_for_tier(
+        for group_candidates in iter_candidates_for_tier(
             reduced_df,
             tolerance_cents=tolerance_cents,
             max_k=max_k_lignes_non_rc,
             allow_multi_rc=autoriser_multi_rc,
             max_rc_per_lettrage=max_rc_par_lettrage,
             max_candidates_per_rc=max_candidats_par_rc,
-        )
-        candidates.extend(tier_candidates)
+            stats=pruning_stats,
+        ):
+            candidates_total += len(group_candidates)
+            update_best_candidates_by_rc(best_by_rc, group_candidates)
+            monitor.sample("candidats")
+    monitor.end_stage("candidats")
 
-    best_by_rc = select_best_candidates_by_rc(candidates)
     selected = resolve_candidates(best_by_rc.values())
-    lettrages_df, lignes_lettrees_df, lignes_restantes_df = build_outputs(filtered_df, selected)
+    del best_by_rc
+    monitor.end_stage("resolution")
+
+    exports: dict[str, Path] = {}
+    if dossier_sortie is None:
+        lettrages_df, lignes_lettrees_df, lignes_restantes_df = build_outputs(filtered_df, selected)
+    else:
+        chunk_rows = export_chunk_rows(filtered_df, budget_memoire_mo, monitor.sample("sorties"))
+        lettrages_df, exports = write_outputs(
+            filtered_df,
+            selected,
+            dossier_sortie,
+            chunk_rows=chunk_rows,
+            on_chunk=lambda: monitor.sample("sorties"),
+        )
+        lignes_lettrees_df = filtered_df.head(0)
+        lignes_restantes_df = filtered_df.head(0)
+    monitor.end_stage("sorties")
 
     duration = round(time.perf_counter() - start, 3)
     metrics = {
         "tiers_total": tiers_total,
-        "candidats": len(candidates),
+        "candidats": candidates_total,
+        **pruning_stats,
         "lettrages_retenus": len(selected),
         "temps_s": duration,
+        **memory_metrics,
     }
 
     return LettrageResult(
@@ -305,4 +594,186 @@ def run_lettrage(
         lignes_lettrees=lignes_lettrees_df,
         lignes_restantes=lignes_restantes_df,
         metrics=metrics,
+        exports=exports,
+    )
+
+
+def _max_rc(settings: ToolSettings) -> int:
+    return settings.max_rc_par_lettrage if settings.autoriser_multi_rc else 1
+
+
+def _enumerate_tier(
+    df: pd.DataFrame,
+    loosest: list[ToolSettings],
+    stats: dict[str, int] | None = None,
+) -> list[_GroupEnumeration]:
+    tolerance_cents = max(int(round(settings.tolerance_eur * 100)) for settings in loosest)
+    max_k = max(settings.max_k_lignes_non_rc for settings in loosest)
+    max_rc = max(_max_rc(settings) for settings in loosest)
+    max_results = max(settings.max_candidats_par_rc for settings in loosest)
+
+    split = _split_tier(df, tolerance_cents)
+    if split is None:
+        return []
+    rc_df, non_rc_amounts = split
+
+    groups: list[_GroupEnumeration] = []
+    reachable = _reachable_groups(
+        _rc_groups(rc_df, max_rc >= 2, max_rc),
+        non_rc_amounts,
+        tolerance_cents,
+        max_k,
+        stats,
     )
+    for rc_ids, rc_sum in reachable:
+        combos = _find_combinations(
+            non_rc_amounts,
+            target=-rc_sum,
+            tolerance=tolerance_cents,
+            max_k=max_k,
+            max_results=max_results,
+        )
+        candidates = [_make_candidate(df, rc_ids, tuple(combo), tolerance_cents) for combo in combos]
+        groups.append(
+            _GroupEnumeration(
+                rc_ids=rc_ids,
+                rc_sum=rc_sum,
+                candidates=[candidate for candidate in candidates if candidate is not None],
+                truncated=len(combos) >= max_results,
+            )
+        )
+    return groups
+
+
+def _derive_tier_candidates(
+    df: pd.DataFrame,
+    groups: list[_GroupEnumeration],
+    settings: ToolSettings,
+) -> tuple[list[LettrageCandidate], int]:
+    tolerance_cents = int(round(settings.tolerance_eur * 100))
+    if not groups or should_skip_tier(df, tolerance_cents):
+        return [], 0
+
+    candidates: list[LettrageCandidate] = []
+    non_rc_amounts: list[tuple[int, int]] | None = None
+    reruns = 0
+    for group in groups:
+        if len(group.rc_ids) > _max_rc(settings):
+            continue
+        # Le DFS strict visite un sous-ensemble des nœuds du DFS large, dans le même ordre :
+        # filtrer l'énumération large donne donc exactement le résultat strict.
+        kept = [
+            candidate
+            for candidate in group.candidates
+            if candidate.ecart_cents <= tolerance_cents
+            and len(candidate.non_rc_ids) <= settings.max_k_lignes_non_rc
+        ][: settings.max_candidats_par_rc]
+        if group.truncated and len(kept) < settings.max_candidats_par_rc:
+            # L'énumération large a été tronquée avant d'atteindre tous les résultats stricts.
+            reruns += 1
+            if non_rc_amounts is None:
+                _, non_rc_amounts = _split_tier(df, tolerance_cents)
+            combos = _find_combinations(
+                non_rc_amounts,
+                target=-group.rc_sum,
+                tolerance=tolerance_cents,
+                max_k=settings.max_k_lignes_non_rc,
+                max_results=settings.max_candidats_par_rc,
+            )
+            kept = []
+            for combo in combos:
+                candidate = _make_candidate(df, group.rc_ids, tuple(combo), tolerance_cents)
+                if candidate is not None:
+                    kept.append(candidate)
+        candidates.extend(kept)
+    return candidates, reruns
+
+
+def run_sweep(
+    df: pd.DataFrame,
+    today: date,
+    settings_grid: Sequence[ToolSettings],
+) -> SweepResult:
+    if not settings_grid:
+        raise ValueError("La grille de paramètres est vide.")
+    start = time.perf_counter()
+    budgets = [settings.budget_memoire_mo for settings in settings_grid if settings.budget_memoire_mo is not None]
+    memory_metrics: dict[str, int | float] = {}
+    monitor = _MemoryMonitor(min(budgets) if budgets else None, memory_metrics)
+
+    filtered_df = filter_base(df, today)
+    monitor.end_stage("filtrage")
+    best_by_config: list[dict[int, LettrageCandidate]] = [{} for _ in settings_grid]
+    candidates_by_config = [0] * len(settings_grid)
+    enumeration_s = 0.0
+    enumerations = 0
+    reruns = 0
+    # Comptés par configuration : chacune reçoit les compteurs de l'énumération partagée qui l'a servie,
+    # ce qui évite de compter plusieurs fois un tiers énuméré pour plusieurs jeux de lignes.
+    pruning_by_config: list[dict[str, int]] = [
+        {"groupes_rc": 0, "groupes_rc_elagues": 0, "tiers_index_ignores": 0} for _ in settings_grid
+    ]
+
+    for _, tier_df in filtered_df.groupby("Code Tiers"):
+        # Les configurations qui retiennent les mêmes lignes pour ce tiers partagent une énumération.
+        reduced_by_max_lines = {
+            max_lines: reduce_tier_lines(tier_df, max_lines)
+            for max_lines in {settings.max_lignes_par_tiers for settings in settings_grid}
+        }
+        configs_by_lines: dict[tuple[int, ...], list[int]] = {}
+        for idx, settings in enumerate(settings_grid):
+            reduced_df = reduced_by_max_lines[settings.max_lignes_par_tiers]
+            configs_by_lines.setdefault(tuple(reduced_df["id_ligne"]), []).append(idx)
+
+        for config_ids in configs_by_lines.values():
+            reduced_df = reduced_by_max_lines[settings_grid[config_ids[0]].max_lignes_par_tiers]
+            enumeration_start = time.perf_counter()
+            enumeration_stats: dict[str, int] = {}
+            groups = _enumerate_tier(reduced_df, [settings_grid[idx] for idx in config_ids], enumeration_stats)
+            enumeration_s += time.perf_counter() - enumeration_start
+            enumerations += 1
+            for idx in config_ids:
+                for key, value in enumeration_stats.items():
+                    pruning_by_config[idx][key] += value
+                tier_candidates, tier_reruns = _derive_tier_candidates(reduced_df, groups, settings_grid[idx])
+                reruns += tier_reruns
+                candidates_by_config[idx] += len(tier_candidates)
+                best_by_config[idx].update(select_best_candidates_by_rc(tier_candidates))
+        monitor.sample("candidats")
+    monitor.end_stage("candidats")
+
+    rows = []
+    selections: list[list[LettrageCandidate]] = []
+    for idx, settings in enumerate(settings_grid):
+        selected = resolve_candidates(best_by_config[idx].values())
+        selections.append(selected)
+        rows.append(
+            {
+                "configuration": idx,
+                "tolerance_eur": settings.tolerance_eur,
+                "max_k_lignes_non_rc": settings.max_k_lignes_non_rc,
+                "max_lignes_par_tiers": settings.max_lignes_par_tiers,
+                "autoriser_multi_rc": settings.autoriser_multi_rc,
+                "max_rc_par_lettrage": settings.max_rc_par_lettrage,
+                "max_candidats_par_rc": settings.max_candidats_par_rc,
+                "candidats": candidates_by_config[idx],
+                **pruning_by_config[idx],
+                "lettrages_retenus": len(selected),
+                "lignes_couvertes": sum(candidate.nb_lignes for candidate in selected),
+                "ecart": cents_to_eur(sum(candidate.ecart_cents for candidate in selected)),
+            }
+        )
+    monitor.end_stage("resolution")
+
+    duration = time.perf_counter() - start
+    metrics = {
+        "configurations": len(settings_grid),
+        "tiers_total": filtered_df["Code Tiers"].nunique(),
+        "enumerations": enumerations,
+        "relances": reruns,
+        "temps_enumeration_s": round(enumeration_s, 3),
+        "temps_derivation_s": round(duration - enumeration_s, 3),
+        "temps_s": round(duration, 3),
+        **memory_metrics,
+    }
+    return SweepResult(comparaison=pd.DataFrame(rows), lettrages=selections, metrics=metrics)
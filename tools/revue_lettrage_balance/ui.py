@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import tempfile
 from datetime import date
 
+import pandas as pd
 import streamlit as st
 
 from core import io
 from core.settings import ToolSettings
-from tools.revue_lettrage_balance.logic import run_lettrage
+from tools.revue_lettrage_balance.logic import LettrageResult, run_lettrage
 
 
 @st.cache_data(show_spinner=False)
@@ -14,6 +16,31 @@ def _load_data(uploaded_file) -> io.ParsedData:
     return io.load_csv(uploaded_file)
 
 
+def _export_dir() -> str:
+    # Un seul dossier par session : le précédent est supprimé à chaque nouvelle analyse, et le
+    # dernier lorsque la session est libérée (nettoyage de TemporaryDirectory).
+    previous = st.session_state.pop("lettrage_export_dir", None)
+    if previous is not None:
+        previous.cleanup()
+    export_dir = tempfile.TemporaryDirectory(prefix="lettrage_")
+    st.session_state["lettrage_export_dir"] = export_dir
+    return export_dir.name
+
+
+def _download_export(label: str, result: LettrageResult, name: str, dataframe: pd.DataFrame) -> None:
+    path = result.exports.get(name)
+    if path is None:
+        data = dataframe.to_csv(index=False).encode("utf-8")
+        file_name = f"{name}.csv"
+    else:
+        # En mode mémoire limitée, les lignes sont exportées compressées : Streamlit garde le fichier
+        # téléchargé en mémoire, mais sous cette forme il ne pèse qu'une fraction du CSV.
+        data = path.read_bytes()
+        file_name = path.name
+    mime = "application/gzip" if file_name.endswith(".gz") else "text/csv"
+    st.download_button(f"{label} ({file_name})", data, file_name=file_name, mime=mime)
+
+
 def render() -> None:
     st.header("Revue lettrage balance")
     st.write(
@@ -39,6 +66,10 @@ def render() -> None:
         max_candidats_par_rc = st.number_input(
             "Max candidats par RC", min_value=50, value=500, step=50
         )
+        mode_memoire_limitee = st.checkbox("Mode mémoire limitée", value=False)
+        budget_memoire_mo = st.number_input(
+            "Budget mémoire (Mo)", min_value=256, value=6144, step=256, disabled=not mode_memoire_limitee
+        )
 
     run = st.button("Lancer")
 
@@ -65,18 +96,26 @@ def render() -> None:
         autoriser_multi_rc=autoriser_multi_rc,
         max_rc_par_lettrage=int(max_rc_par_lettrage),
         max_candidats_par_rc=int(max_candidats_par_rc),
+        budget_memoire_mo=int(budget_memoire_mo) if mode_memoire_limitee else None,
     )
-
-    result = run_lettrage(
-        df,
-        today=date.today(),
-        tolerance_eur=settings.tolerance_eur,
-        max_k_lignes_non_rc=settings.max_k_lignes_non_rc,
-        max_lignes_par_tiers=settings.max_lignes_par_tiers,
-        autoriser_multi_rc=settings.autoriser_multi_rc,
-        max_rc_par_lettrage=settings.max_rc_par_lettrage,
-        max_candidats_par_rc=settings.max_candidats_par_rc,
-    )
+    dossier_sortie = _export_dir() if mode_memoire_limitee else None
+
+    try:
+        result = run_lettrage(
+            df,
+            today=date.today(),
+            tolerance_eur=settings.tolerance_eur,
+            max_k_lignes_non_rc=settings.max_k_lignes_non_rc,
+            max_lignes_par_tiers=settings.max_lignes_par_tiers,
+            autoriser_multi_rc=settings.autoriser_multi_rc,
+            max_rc_par_lettrage=settings.max_rc_par_lettrage,
+            max_candidats_par_rc=settings.max_candidats_par_rc,
+            budget_memoire_mo=settings.budget_memoire_mo,
+            dossier_sortie=dossier_sortie,
+        )
+    except MemoryError as exc:
+        st.error(str(exc))
+        return
 
     st.subheader("Résultats")
     metrics = result.metrics
@@ -85,6 +124,15 @@ def render() -> None:
     metric_cols[1].metric("Candidats", metrics["candidats"])
     metric_cols[2].metric("Lettrages retenus", metrics["lettrages_retenus"])
     metric_cols[3].metric("Temps (s)", metrics["temps_s"])
+    if mode_memoire_limitee:
+        st.caption(
+            "Pic mémoire (Mo) — "
+            + ", ".join(
+                f"{key.removeprefix('rss_pic_mo_')}: {value}"
+                for key, value in metrics.items()
+                if key.startswith("rss_pic_mo_")
+            )
+        )
 
     lettrages = result.lettrages
     lettrages_df = result.lettrages_df
@@ -102,24 +150,9 @@ def render() -> None:
                 st.dataframe(lines, use_container_width=True)
 
         st.subheader("Exports")
-        st.download_button(
-            "Télécharger lettrages_synthese.csv",
-            lettrages_df.to_csv(index=False).encode("utf-8"),
-            file_name="lettrages_synthese.csv",
-            mime="text/csv",
-        )
-        st.download_button(
-            "Télécharger lignes_lettrees.csv",
-            lignes_lettrees_df.to_csv(index=False).encode("utf-8"),
-            file_name="lignes_lettrees.csv",
-            mime="text/csv",
-        )
+        _download_export("Télécharger lettrages_synthese", result, "lettrages_synthese", lettrages_df)
+        _download_export("Télécharger lignes_lettrees", result, "lignes_lettrees", lignes_lettrees_df)
     else:
         st.info("Aucun lettrage trouvé avec les paramètres actuels.")
 
-    st.download_button(
-        "Télécharger lignes_restantes.csv",
-        lignes_restantes_df.to_csv(index=False).encode("utf-8"),
-        file_name="lignes_restantes.csv",
-        mime="text/csv",
-    )
+    _download_export("Télécharger lignes_restantes", result, "lignes_restantes", lignes_restantes_df)